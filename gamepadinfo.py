@@ -1,6 +1,9 @@
 #!/usr/bin/python3
 """Detect gamepads and show their state on Linux."""
+# pylint: disable=too-many-lines
 import os
+import time
+import json
 import datetime
 import queue
 import struct
@@ -11,6 +14,13 @@ import traceback
 import array
 import asyncio
 import select
+import argparse
+import socket
+import mmap
+import errno
+import sys
+import itertools
+import re
 
 import urwid
 import pyudev
@@ -156,6 +166,15 @@ def scan_jsio_gamepads():
                 fcntl.ioctl(jsfile.fileno(), JSIOCGNAME + (0x10000 * len(buf)), buf)
                 data['name'] = str(buf.tobytes(), 'utf-8').rstrip("\x00")
 
+            try:
+                ids = {}
+                for field in ('bustype', 'vendor', 'product', 'version'):
+                    with open('/sys/class/input/%s/device/id/%s' % (os.path.basename(fn), field), encoding='ascii') as id_file:
+                        ids[field] = int(id_file.read(), 16)
+                data['guid'] = make_guid(ids['bustype'], ids['vendor'], ids['product'], ids['version'])
+            except (OSError, ValueError):
+                pass  # no ids so matching with other backends falls back to name
+
             if fn not in INPUT_DEVICES:
                 INPUT_DEVICES[fn] = {}
             INPUT_DEVICES[fn]['jsio'] = data
@@ -175,22 +194,62 @@ def present_jsio_gamepad(data):
     return text
 
 
+def _index_input_devices(backend, guid_func, name_func):
+    """Index devices found by given backend by GUID, by (bustype, vendor, product) and list them with their names.
+
+    Devices with the same key are kept in order of their files numbers, e.g. event2 before event10.
+    """
+    by_guid = {}
+    by_ids = {}
+    names = []
+    for fn in sorted(INPUT_DEVICES, key=lambda fn: [int(p) if p.isdigit() else p for p in re.split(r'(\d+)', fn)]):
+        data = INPUT_DEVICES[fn]
+        if backend not in data:
+            continue
+        guid = guid_func(data[backend])
+        if guid:
+            guid = normalize_guid(guid)
+            by_guid.setdefault(guid, []).append(data)
+            ids = _guid_ids(guid)
+            if ids:
+                by_ids.setdefault(ids, []).append(data)
+        names.append((name_func(data[backend]), data))
+    return by_guid, by_ids, names
+
+
+def _find_unmatched_device(indexes, matched_backend, guid, name):
+    """Find first device not matched yet to matched_backend so identical pads are matched one to one.
+
+    It is a fallback for backends that do not report device file. Devices are looked up by GUID,
+    then by (bustype, vendor, product) as the version in GUID can differ, e.g. with SDL2 HIDAPI driver,
+    and finally by name prefix as backends can report truncated names.
+    """
+    by_guid, by_ids, names = indexes
+    candidates = []
+    if guid:
+        guid = normalize_guid(guid)
+        ids = _guid_ids(guid)
+        candidates = itertools.chain(by_guid.get(guid, []), by_ids.get(ids, []) if ids else [])
+    candidates = itertools.chain(candidates, (d for n, d in names if n.startswith(name)))
+    for d in candidates:
+        if matched_backend not in d:
+            return d
+    return None
+
+
 def scan_pygame_gamepads():
     """Scan for pygame gamepads."""
     import pygame  # pylint: disable=import-error
     pygame.init()
     pygame.joystick.init()
+    indexes = _index_input_devices('jsio', lambda data: data.get('guid'), lambda data: data['name'].strip())
     for i in range(pygame.joystick.get_count()):
         j = pygame.joystick.Joystick(i)
         j.init()
-        name = j.get_name().strip()
-
-        for d in INPUT_DEVICES.values():
-            if 'jsio' not in d:
-                continue
-            n = d['jsio']['name'].strip()
-            if n.startswith(name):
-                d['pygame'] = j
+        guid = j.get_guid() if hasattr(j, 'get_guid') else None
+        d = _find_unmatched_device(indexes, 'pygame', guid, j.get_name().strip())
+        if d:
+            d['pygame'] = j
 
 
 def present_pygame_gamepad(data):
@@ -207,29 +266,210 @@ def present_pygame_gamepad(data):
 
 def scan_sdl2_gamepads():
     """Scan for sdl2 gamepads."""
+    # SDL would catch SIGINT and SIGTERM and only queue SDL_QUIT event that nobody reads
+    sdl2.SDL_SetHint(sdl2.SDL_HINT_NO_SIGNAL_HANDLERS, b'1')
     sdl2.SDL_Init(sdl2.SDL_INIT_JOYSTICK | sdl2.SDL_INIT_GAMECONTROLLER)
+    indexes = _index_input_devices('evdev', evdev_guid, lambda dev: dev.name.strip())
+    unmatched = []
     num = sdl2.joystick.SDL_NumJoysticks()
     for i in range(num):
         j = sdl2.joystick.SDL_JoystickOpen(i)
+        # device file is the only exact match, identical pads cannot be told apart by anything else
+        d = INPUT_DEVICES.get(_sdl_joystick_path(i))
+        if d and 'evdev' in d and 'sdl2' not in d:
+            d['sdl2'] = j
+        else:
+            unmatched.append(j)
+    for j in unmatched:
+        guid = sdl_joystickgetguidstring(sdl2.joystick.SDL_JoystickGetGUID(j))
         name = str(sdl2.SDL_JoystickName(j).strip(), 'utf-8')
-        for d in INPUT_DEVICES.values():
-            if 'evdev' not in d:
-                continue
-            n = d['evdev'].name
-            if n.startswith(name):
-                d['sdl2'] = j
+        d = _find_unmatched_device(indexes, 'sdl2', guid, name)
+        if d:
+            d['sdl2'] = j
+
 
-        # guid = sdl2.joystick.SDL_JoystickGetGUID(js)
-        # my_guid = SDL_JoystickGetGUIDString(guid)
+def _sdl_joystick_path(index):
+    """Return device file of SDL2 joystick or None if it is not known, SDL2 reports it since 2.24."""
+    path_for_index = getattr(sdl2.joystick, 'SDL_JoystickPathForIndex', None)
+    if path_for_index is None:
+        return None
+    try:
+        path = path_for_index(index)
+    except RuntimeError:
+        return None  # older SDL2 library
+    return str(path, 'utf-8') if path else None
 
 
 def sdl_joystickgetguidstring(guid):
     """Get SDL2 GUID from low level data."""
-    s = ''
-    for g in guid.data:
-        s += "{:x}".format(g >> 4)
-        s += "{:x}".format(g & 0x0F)
-    return s
+    return bytes(guid.data).hex()
+
+
+def make_guid(bustype, vendor, product, version):
+    """Build SDL2 GUID the same way as SDL2 does on Linux for devices with vendor and product ids."""
+    return struct.pack('<8H', bustype, 0, vendor, 0, product, 0, version, 0).hex()
+
+
+def evdev_guid(dev):
+    """Build SDL2 GUID of evdev device."""
+    return make_guid(dev.info.bustype, dev.info.vendor, dev.info.product, dev.info.version)
+
+
+def normalize_guid(guid):
+    """Clear name CRC that newer SDL2 versions store in GUID so GUIDs from all versions can be compared."""
+    guid = guid.lower()
+    return guid[:4] + '0000' + guid[8:]
+
+
+def _guid_ids(guid):
+    """Return (bustype, vendor, product) encoded in GUID or None if GUID is not built from them."""
+    try:
+        bustype, _, vendor, zero1, product, zero2 = struct.unpack_from('<6H', bytes.fromhex(guid))
+    except (ValueError, struct.error):
+        return None
+    if zero1 or zero2 or not vendor:
+        return None
+    return bustype, vendor, product
+
+
+# fields of SDL2 mapping that do not map inputs
+SDL_MAPPING_FIELDS = ('platform', 'crc', 'hint', 'sdk>=', 'sdk<=')
+SDL_AXES = ('leftx', 'lefty', 'rightx', 'righty', 'lefttrigger', 'righttrigger')
+
+
+class ControllerDB(object):
+    """Database of SDL2 game controller mappings in gamecontrollerdb.txt format.
+
+    Mappings are indexed by GUID and by (bustype, vendor, product) encoded in GUID.
+    Mapping fields are parsed only when a mapping is looked up.
+    """
+    def __init__(self):
+        self.by_guid = {}
+        self.by_ids = {}
+        self.count = 0
+        self.sources = []
+
+    def load(self, path):
+        with open(path, encoding='utf-8') as db_file:
+            self.load_text(db_file.read(), path)
+
+    def load_text(self, text, source):
+        start = time.perf_counter()
+        count = 0
+        for line in text.splitlines():
+            line = line.strip()
+            if not line or line[0] == '#':
+                continue
+            guid, _, rest = line.partition(',')
+            name, _, fields = rest.partition(',')
+            if not fields:
+                continue
+            idx = fields.find('platform:')
+            if idx >= 0 and not fields.startswith('Linux', idx + 9):
+                continue
+            guid = normalize_guid(guid)
+            # the later entry wins like in SDL2
+            mapping = [guid, name, fields]
+            self.by_guid[guid] = mapping
+            ids = _guid_ids(guid)
+            if ids:
+                self.by_ids[ids] = mapping
+            count += 1
+        self.count += count
+        self.sources.append((source, count, time.perf_counter() - start))
+
+    def find(self, guid):
+        """Return (name, {target: source}, matched by) for GUID or None."""
+        guid = normalize_guid(guid)
+        mapping = self.by_guid.get(guid)
+        matched_by = 'guid'
+        if mapping is None:
+            mapping = self.by_ids.get(_guid_ids(guid))
+            matched_by = 'bus/vendor/product'
+        if mapping is None:
+            return None
+        if isinstance(mapping[2], str):
+            fields = {}
+            for field in mapping[2].split(','):
+                target, _, src = field.partition(':')
+                if src and target not in SDL_MAPPING_FIELDS:
+                    fields[target] = src
+            mapping[2] = fields
+        return mapping[1], mapping[2], matched_by
+
+
+CONTROLLER_DB = ControllerDB()
+
+
+def sdl_evdev_inputs(dev):
+    """Return evdev codes of buttons, axes and hats in order in which SDL2 numbers them on Linux."""
+    caps = dev.capabilities(absinfo=False)
+    keys = caps.get(evdev.ecodes.EV_KEY, [])
+    buttons = sorted(k for k in keys if k >= evdev.ecodes.BTN_JOYSTICK) + sorted(k for k in keys if k < evdev.ecodes.BTN_JOYSTICK)
+    abs_codes = caps.get(evdev.ecodes.EV_ABS, [])
+    axes = sorted(a for a in abs_codes if not evdev.ecodes.ABS_HAT0X <= a <= evdev.ecodes.ABS_HAT3Y)
+    hats = [a for a in range(evdev.ecodes.ABS_HAT0X, evdev.ecodes.ABS_HAT3Y, 2) if a in abs_codes or a + 1 in abs_codes]
+    return buttons, axes, hats
+
+
+def _sdl_input_code(src, inputs):
+    """Return (kind, index) of input referenced by SDL2 mapping source, e.g. b3, +a2, a5~ or h0.4."""
+    src = src.lstrip('+-').rstrip('~')
+    try:
+        if src[0] == 'b':
+            return 'button', inputs[0][int(src[1:])]
+        if src[0] == 'a':
+            return 'axis', inputs[1][int(src[1:])]
+        if src[0] == 'h':
+            return 'hat', inputs[2][int(src[1:].split('.')[0])]
+    except (IndexError, ValueError):
+        pass
+    return None, None
+
+
+def present_controller_mapping(dev):
+    """Generate description of controller database mapping of evdev gamepad for urwid."""
+    text = [('emph', "CONTROLLER DB:",)]
+    guid = evdev_guid(dev)
+    text.append('   guid: %s' % guid)
+    found = CONTROLLER_DB.find(guid)
+    if found is None:
+        text.append('   mapping: [not found among %d mappings]' % CONTROLLER_DB.count)
+        return text
+    name, fields, matched_by = found
+    text.append("   mapping: '%s' (matched by %s)" % (name, matched_by))
+
+    inputs = sdl_evdev_inputs(dev)
+    buttons, axes, used = _describe_mapping_fields(fields, inputs)
+    text.append('   buttons: %s' % ", ".join(buttons))
+    text.append('   axes: %s' % ", ".join(axes))
+
+    unmapped = [BUTTON_NAMES[k] for k in inputs[0] if ('button', k) not in used]
+    unmapped += [evdev.ecodes.ABS[a][4:] for a in inputs[1] if ('axis', a) not in used]
+    unmapped += [evdev.ecodes.ABS[h][4:-1] for h in inputs[2] if ('hat', h) not in used]
+    text.append('   unmapped: %s' % (", ".join(unmapped) or '-'))
+    return text
+
+
+def _describe_mapping_fields(fields, inputs):
+    """Describe mapped buttons and axes with evdev names. Return them and set of used (kind, code) inputs."""
+    used = set()
+    buttons = []
+    axes = []
+    for target, src in sorted(fields.items()):
+        kind, code = _sdl_input_code(src, inputs)
+        if kind is None:
+            desc = '%s=%s[missing]' % (target, src)
+        else:
+            used.add((kind, code))
+            if kind == 'button':
+                desc = '%s=%s' % (target, BUTTON_NAMES[code])
+            elif kind == 'hat':
+                desc = '%s=%s.%s' % (target, evdev.ecodes.ABS[code][4:-1], src.split('.')[-1])
+            else:
+                desc = '%s=%s' % (target, evdev.ecodes.ABS[code][4:])
+        (axes if target.lstrip('+-') in SDL_AXES else buttons).append(desc)
+    return buttons, axes, used
 
 
 def present_sdl2_gamepad(j):
@@ -244,6 +484,716 @@ def present_sdl2_gamepad(j):
     return text
 
 
+class LatencyStats(object):
+    """Collect latency samples (in seconds) and summarize them."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.last = None
+
+    def add(self, sample):
+        self.count += 1
+        self.total += sample
+        self.last = sample
+        if self.min is None or sample < self.min:
+            self.min = sample
+        if self.max is None or sample > self.max:
+            self.max = sample
+
+    def __str__(self):
+        if not self.count:
+            return 'n/a'
+        return 'last %.3f ms, min %.3f ms, avg %.3f ms, max %.3f ms (%d samples)' % (
+            self.last * 1000, self.min * 1000, self.total / self.count * 1000, self.max * 1000, self.count)
+
+
+def load_remap_config(path):
+    """Load remap configuration from JSON file.
+
+    Example of config:
+    {"keys": {"BTN_X": "BTN_Y", "BTN_Y": "BTN_X", "BTN_Z": null},
+     "axes": {"ABS_Y": {"invert": true, "deadzone": 0.1},
+              "ABS_RZ": {"min": 10, "max": 245, "center": 10, "to": "ABS_GAS"}}}
+    """
+    with open(path, encoding='utf-8') as cfg_file:
+        config = json.load(cfg_file)
+    validate_remap_config(config)
+    return config
+
+
+def _ecode(name, prefixes=None):
+    """Convert evdev code name (e.g. BTN_A) or number to its number.
+
+    If prefixes are given the name has to start with one of them.
+    """
+    if name is None or isinstance(name, int):
+        return name
+    if not isinstance(name, str) or name not in evdev.ecodes.ecodes:
+        raise ValueError("unknown evdev code '%s'" % (name,))
+    if prefixes and not name.startswith(prefixes):
+        raise ValueError("evdev code '%s' is not one of %s" % (name, '/'.join(p + '*' for p in prefixes)))
+    return evdev.ecodes.ecodes[name]
+
+
+def _key_name(code):
+    names = evdev.ecodes.BTN.get(code) or evdev.ecodes.KEY.get(code, str(code))
+    if isinstance(names, (tuple, list)):
+        names = '/'.join(names)
+    return names
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+REMAP_AXIS_OPTIONS = ('min', 'max', 'center', 'deadzone', 'invert', 'to')
+
+
+def validate_remap_config(config):
+    """Check structure and values of remap config, raise ValueError if it is wrong."""
+    if not isinstance(config, dict):
+        raise ValueError('remap config has to be an object')
+    unknown = set(config) - {'keys', 'axes'}
+    if unknown:
+        raise ValueError('unknown remap config sections: %s' % ', '.join(sorted(unknown)))
+
+    keys = config.get('keys', {})
+    if not isinstance(keys, dict):
+        raise ValueError('keys have to be an object mapping button to button or null')
+    for src, dst in keys.items():
+        _ecode(src, ('KEY_', 'BTN_'))
+        if dst is not None and not isinstance(dst, str):
+            raise ValueError('target of %s has to be a button name or null' % src)
+        _ecode(dst, ('KEY_', 'BTN_'))
+
+    axes = config.get('axes', {})
+    if not isinstance(axes, dict):
+        raise ValueError('axes have to be an object mapping axis to its options')
+    for name, cfg in axes.items():
+        _validate_remap_axis(name, cfg)
+
+
+def _validate_remap_axis(name, cfg):
+    _ecode(name, ('ABS_',))
+    if not isinstance(cfg, dict):
+        raise ValueError('options of %s have to be an object' % name)
+    unknown = set(cfg) - set(REMAP_AXIS_OPTIONS)
+    if unknown:
+        raise ValueError('unknown options of %s: %s' % (name, ', '.join(sorted(unknown))))
+    for opt in ('min', 'max', 'center', 'deadzone'):
+        if opt in cfg and not _is_number(cfg[opt]):
+            raise ValueError('%s of %s has to be a number' % (opt, name))
+    if 'min' in cfg and 'max' in cfg and cfg['min'] >= cfg['max']:
+        raise ValueError('min of %s has to be lower than max' % name)
+    if 'center' in cfg and not cfg.get('min', cfg['center']) <= cfg['center'] <= cfg.get('max', cfg['center']):
+        raise ValueError('center of %s has to be in range [min, max]' % name)
+    if not 0.0 <= cfg.get('deadzone', 0.0) < 1.0:
+        raise ValueError("deadzone of %s has to be in range [0, 1)" % name)
+    if not isinstance(cfg.get('invert', False), bool):
+        raise ValueError('invert of %s has to be true or false' % name)
+    if not isinstance(cfg.get('to', name), str):
+        raise ValueError('to of %s has to be an axis name' % name)
+    _ecode(cfg.get('to', name), ('ABS_',))
+
+
+# axes with more values than this are transformed on the fly instead of by a lookup table
+MAX_AXIS_LUT_SIZE = 1 << 17
+
+
+def _transform_axis_value(params, raw):
+    """Apply calibration, deadzone and inversion to raw axis value."""
+    (out_min, out_max, cal_min, cal_max, center, out_center, deadzone, invert) = params
+    if raw >= center:
+        span = cal_max - center
+        norm = float(raw - center) / span if span > 0 else 0.0
+    else:
+        span = center - cal_min
+        norm = float(raw - center) / span if span > 0 else 0.0
+    norm = max(-1.0, min(1.0, norm))
+    if abs(norm) <= deadzone:
+        norm = 0.0
+    else:
+        norm = (abs(norm) - deadzone) / (1.0 - deadzone) * (1 if norm > 0 else -1)
+    if norm >= 0:
+        value = out_center + norm * (out_max - out_center)
+    else:
+        value = out_center + norm * (out_center - out_min)
+    value = int(round(value))
+    if invert:
+        value = out_max + out_min - value
+    return value
+
+
+def _axis_params(name, info, cfg):
+    """Return transform params of axis for _transform_axis_value from its absinfo and config."""
+    deadzone = float(cfg.get('deadzone', 0.0))
+    cal_min = cfg.get('min', info.min)
+    cal_max = cfg.get('max', info.max)
+    if cal_min >= cal_max:
+        raise ValueError("min of %s has to be lower than max, got %s and %s" % (name, cal_min, cal_max))
+    center = cfg.get('center', (cal_min + cal_max) / 2.0)
+    if not cal_min <= center <= cal_max:
+        raise ValueError("center of %s has to be in range [%s, %s], got %s" % (name, cal_min, cal_max, center))
+    out_center = info.min + float(center - cal_min) / (cal_max - cal_min) * (info.max - info.min)
+    return (info.min, info.max, cal_min, cal_max, center, out_center, deadzone, bool(cfg.get('invert', False)))
+
+
+class EventRemapper(object):
+    """Remap buttons and axes of evdev device and apply calibration and deadzones to axes.
+
+    All axis transforms are precomputed into lookup tables so handling an event
+    is reduced to a dict lookup and an array indexing.
+    """
+    def __init__(self, device, config=None):
+        config = config or {}
+        self.caps = device.capabilities()
+
+        self.keys = {}
+        for src, dst in config.get('keys', {}).items():
+            self.keys[_ecode(src)] = _ecode(dst)
+        # two buttons emitting the same code would release it while the other one is still held
+        emitted = {}
+        for code in self.caps.get(evdev.ecodes.EV_KEY, []):
+            target = self.keys.get(code, code)
+            if target is None:
+                continue
+            if target in emitted:
+                raise ValueError("buttons %s and %s would be both emitted as %s" % (
+                    _key_name(emitted[target]), _key_name(code), _key_name(target)))
+            emitted[target] = code
+
+        # axis code -> (target code, min, max, lookup table or None, transform params)
+        self.axes = {}
+        axes_cfg = {_ecode(a): cfg for a, cfg in config.get('axes', {}).items()}
+        emitted = {}
+        for code, info in self.caps.get(evdev.ecodes.EV_ABS, []):
+            target = code
+            if code in axes_cfg:
+                cfg = axes_cfg.pop(code)
+                params = _axis_params(evdev.ecodes.ABS[code], info, cfg)
+                if info.max - info.min + 1 <= MAX_AXIS_LUT_SIZE:
+                    table = array.array('i', [_transform_axis_value(params, raw) for raw in range(info.min, info.max + 1)])
+                else:
+                    table = None
+                target = _ecode(cfg.get('to', code))
+                self.axes[code] = (target, info.min, info.max, table, params)
+            if target in emitted:
+                raise ValueError("axes %s and %s would be both emitted as %s" % (
+                    evdev.ecodes.ABS[emitted[target]], evdev.ecodes.ABS[code], evdev.ecodes.ABS.get(target, str(target))))
+            emitted[target] = code
+        if axes_cfg:
+            raise ValueError("device does not have axes: %s" % ", ".join(evdev.ecodes.ABS.get(a, str(a)) for a in axes_cfg))
+
+    def capabilities(self):
+        """Return capabilities for uinput device that emits remapped events."""
+        caps = {}
+        for etype, codes in self.caps.items():
+            if etype in (evdev.ecodes.EV_SYN, evdev.ecodes.EV_FF):
+                continue
+            if etype == evdev.ecodes.EV_KEY:
+                codes = sorted(set(self.keys.get(c, c) for c in codes) - {None})
+            elif etype == evdev.ecodes.EV_ABS:
+                codes = [(self.axes[c][0] if c in self.axes else c, info) for c, info in codes]
+            caps[etype] = codes
+        return caps
+
+    def transform(self, etype, code, value):
+        """Return transformed (type, code, value) or None if event should be dropped."""
+        if etype == evdev.ecodes.EV_KEY:
+            code = self.keys.get(code, code)
+            if code is None:
+                return None
+        elif etype == evdev.ecodes.EV_ABS:
+            axis = self.axes.get(code)
+            if axis is not None:
+                code, lo, hi, table, params = axis
+                value = lo if value < lo else hi if value > hi else value
+                if table is None:
+                    value = _transform_axis_value(params, value)
+                else:
+                    value = table[value - lo]
+        return etype, code, value
+
+
+class EvdevPassthrough(object):
+    """Grab evdev device exclusively and re-emit its remapped events through uinput virtual device."""
+    def __init__(self, device, remapper):
+        self.device = device
+        self.remapper = remapper
+        self.uinput = None
+        self.forwarded = 0
+        self.dropped = 0
+        # time spent in gamepadinfo on each event: transforming and writing it to uinput
+        self.added_latency = LatencyStats()
+        # time from kernel event timestamp to writing it to uinput
+        self.total_latency = LatencyStats()
+
+    def start(self):
+        info = self.device.info
+        self.uinput = evdev.UInput(events=self.remapper.capabilities(),
+                                   name='gamepadinfo passthrough: %s' % self.device.name,
+                                   vendor=info.vendor, product=info.product,
+                                   version=info.version, bustype=info.bustype)
+        try:
+            self.device.grab()
+        except OSError:
+            self.uinput.close()
+            self.uinput = None
+            raise
+
+    def stop(self):
+        if self.uinput is None:
+            return
+        try:
+            self.device.ungrab()
+        except OSError:
+            pass  # device could be already unplugged
+        self.uinput.close()
+        self.uinput = None
+
+    def forward(self, event):
+        """Transform and re-emit event. Return added latency in seconds or None if event was dropped."""
+        start = time.perf_counter()
+        transformed = self.remapper.transform(event.type, event.code, event.value)
+        if transformed is None:
+            self.dropped += 1
+            return None
+        self.uinput.write(*transformed)
+        now = time.perf_counter()
+        self.forwarded += 1
+        added = now - start
+        self.added_latency.add(added)
+        self.total_latency.add(time.time() - event.timestamp())
+        return added
+
+
+def present_passthrough(passthrough):
+    """Generate description of evdev passthrough for urwid."""
+    text = [('emph', "PASSTHROUGH:",)]
+    if passthrough.uinput is None:
+        text.append('   uinput: closed')
+    elif passthrough.uinput.device:
+        text.append('   uinput: %s' % passthrough.uinput.device.fn)
+    keys = ['%s->%s' % (BUTTON_NAMES.get(s, s), BUTTON_NAMES.get(d, d) if d is not None else '[drop]')
+            for s, d in passthrough.remapper.keys.items()]
+    text.append('   remapped keys: %s' % ", ".join(keys))
+    axes = ['%s->%s' % (evdev.ecodes.ABS[s][4:], evdev.ecodes.ABS[a[0]][4:]) for s, a in passthrough.remapper.axes.items()]
+    text.append('   transformed axes: %s' % ", ".join(axes))
+    text.append('   forwarded events: %d, dropped: %d' % (passthrough.forwarded, passthrough.dropped))
+    text.append('   added latency: %s' % passthrough.added_latency)
+    text.append('   total latency: %s' % passthrough.total_latency)
+    return text
+
+
+# steps of force feedback script: strong and weak rumble magnitudes (0-0xffff), duration and pause after it in ms
+DEFAULT_FF_SCRIPT = [dict(strong=0xffff, weak=0, duration=300, pause=200),
+                     dict(strong=0, weak=0xffff, duration=300, pause=200),
+                     dict(strong=0x8000, weak=0x8000, duration=500, pause=0)]
+
+
+def load_ff_script(path):
+    """Load force feedback script from JSON file with a list of steps, e.g.
+    [{"strong": 65535, "weak": 0, "duration": 300, "pause": 200}, {"strong": 0, "weak": 32768, "duration": 500}]
+    """
+    with open(path, encoding='utf-8') as script_file:
+        script = json.load(script_file)
+    if not isinstance(script, list) or not all(isinstance(step, dict) and 'duration' in step for step in script):
+        raise ValueError('script has to be a list of steps with duration')
+    # effect fields are u16 so larger values would be silently truncated
+    for i, step in enumerate(script):
+        for field in ('strong', 'weak'):
+            value = step.get(field, 0)
+            if not isinstance(value, int) or isinstance(value, bool) or not 0 <= value <= 0xffff:
+                raise ValueError('%s of step %d has to be an integer in range [0, 65535]' % (field, i + 1))
+        for field in ('duration', 'pause'):
+            value = step.get(field, 0)
+            if not _is_number(value) or not 0 <= value <= 0xffff:
+                raise ValueError('%s of step %d has to be a number of ms in range [0, 65535]' % (field, i + 1))
+    return script
+
+
+def _ff_name(code):
+    names = evdev.ecodes.FF.get(code, str(code))
+    if isinstance(names, (tuple, list)):
+        names = [n for n in names if not n.endswith(('_MIN', '_MAX'))][0]
+    return names[3:]
+
+
+class ForceFeedbackExerciser(object):
+    """Upload force feedback effects to evdev device, play them and measure syscalls latency.
+
+    Only capabilities, upload_effect, erase_effect, write and ff_effects_count of the device
+    are used (and fn when run from the UI) so it can be a uinput virtual device or any stand-in
+    providing them, like FFDeviceStandIn.
+    """
+    # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    def __init__(self, device, script=None):
+        self.device = device
+        self.script = script or DEFAULT_FF_SCRIPT
+        ff_caps = device.capabilities().get(evdev.ecodes.EV_FF, [])
+        if evdev.ecodes.FF_RUMBLE in ff_caps:
+            self.effect_type = evdev.ecodes.FF_RUMBLE
+        elif evdev.ecodes.FF_PERIODIC in ff_caps and evdev.ecodes.FF_SINE in ff_caps:
+            self.effect_type = evdev.ecodes.FF_PERIODIC
+        else:
+            raise ValueError('device supports neither rumble nor periodic sine force feedback effects')
+
+        self.slots = device.ff_effects_count
+        self.slots_used = 0
+        self.slots_used_max = 0
+        self.played = 0
+        self.errors = []
+        self.state = 'idle'
+        self.upload_latency = LatencyStats()
+        self.play_latency = LatencyStats()
+        self.stop_latency = LatencyStats()
+        self.erase_latency = LatencyStats()
+
+    def _make_effect(self, step):
+        replay = evdev.ff.Replay(int(step['duration']), 0)
+        strong = int(step.get('strong', 0))
+        weak = int(step.get('weak', 0))
+        if self.effect_type == evdev.ecodes.FF_RUMBLE:
+            effect_type = evdev.ff.EffectType(ff_rumble_effect=evdev.ff.Rumble(strong_magnitude=strong, weak_magnitude=weak))
+        else:
+            magnitude = max(strong, weak) // 2  # periodic magnitude is signed 16-bit
+            periodic = evdev.ff.Periodic(waveform=evdev.ecodes.FF_SINE, period=50, magnitude=magnitude)
+            effect_type = evdev.ff.EffectType(ff_periodic_effect=periodic)
+        return evdev.ff.Effect(self.effect_type, -1, 0, evdev.ff.Trigger(0, 0), replay, effect_type)
+
+    def _timed(self, stats, func, *args):
+        """Call func and measure its latency. Return (succeeded, result)."""
+        start = time.perf_counter()
+        try:
+            return True, func(*args)
+        except OSError as e:
+            self.errors.append('%s: %s' % (func.__name__, e))
+            return False, None
+        finally:
+            stats.add(time.perf_counter() - start)
+
+    async def run(self):
+        """Upload all effects of the script, play them one by one and erase them."""
+        self.state = 'uploading'
+        effect_ids = []
+        for step in self.script:
+            uploaded, effect_id = self._timed(self.upload_latency, self.device.upload_effect, self._make_effect(step))
+            effect_ids.append(effect_id if uploaded else None)
+            if uploaded:
+                self.slots_used += 1
+                self.slots_used_max = max(self.slots_used, self.slots_used_max)
+
+        self.state = 'playing'
+        try:
+            for step, effect_id in zip(self.script, effect_ids):
+                if effect_id is None:
+                    continue
+                played, _ = self._timed(self.play_latency, self.device.write, evdev.ecodes.EV_FF, effect_id, 1)
+                if not played:
+                    continue
+                self.played += 1
+                await asyncio.sleep(step['duration'] / 1000.0)
+                self._timed(self.stop_latency, self.device.write, evdev.ecodes.EV_FF, effect_id, 0)
+                await asyncio.sleep(step.get('pause', 0) / 1000.0)
+        finally:
+            for effect_id in effect_ids:
+                if effect_id is None:
+                    continue
+                erased, _ = self._timed(self.erase_latency, self.device.erase_effect, effect_id)
+                if erased:
+                    self.slots_used -= 1
+            self.state = 'done'
+
+
+class FFDeviceStandIn(object):
+    """In-process stand-in of force feedback evdev device for exercising ForceFeedbackExerciser without hardware.
+
+    Methods listed in fail raise EIO.
+    """
+    fn = 'stand-in'  # pylint: disable=invalid-name
+
+    def __init__(self, slots=16, fail=()):
+        self.ff_effects_count = slots
+        self.fail = fail
+        self.effects = {}
+        self.playing = set()
+
+    def _check(self, name):
+        if name in self.fail:
+            raise OSError(errno.EIO, os.strerror(errno.EIO))
+
+    def capabilities(self):
+        return {evdev.ecodes.EV_FF: [evdev.ecodes.FF_RUMBLE]}
+
+    def upload_effect(self, effect):
+        self._check('upload_effect')
+        free = [i for i in range(self.ff_effects_count) if i not in self.effects]
+        if not free:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        self.effects[free[0]] = effect
+        return free[0]
+
+    def erase_effect(self, effect_id):
+        self._check('erase_effect')
+        del self.effects[effect_id]
+        self.playing.discard(effect_id)
+
+    def write(self, etype, code, value):
+        self._check('write')
+        if etype == evdev.ecodes.EV_FF and value:
+            self.playing.add(code)
+        else:
+            self.playing.discard(code)
+
+
+def ff_selftest():
+    """Run force feedback exerciser against stand-in devices and check its accounting. Return True if all is fine."""
+    script = [dict(strong=0xffff, weak=0, duration=1), dict(strong=0, weak=0xffff, duration=1), dict(strong=1, weak=1, duration=1)]
+    # (stand-in, expected played, expected slots used at most, expected slots used at the end)
+    cases = [(FFDeviceStandIn(), 3, 3, 0),
+             (FFDeviceStandIn(slots=2), 2, 2, 0),
+             (FFDeviceStandIn(fail=('write',)), 0, 3, 0),
+             (FFDeviceStandIn(fail=('erase_effect',)), 3, 3, 3),
+             (FFDeviceStandIn(fail=('upload_effect',)), 0, 0, 0)]
+    ok = True
+    aloop = asyncio.get_event_loop()
+    for device, played, slots_used_max, slots_used in cases:
+        exerciser = ForceFeedbackExerciser(device, script)
+        aloop.run_until_complete(exerciser.run())
+        result = (exerciser.played, exerciser.slots_used_max, exerciser.slots_used)
+        passed = result == (played, slots_used_max, slots_used)
+        ok = ok and passed
+        print('%s: stand-in with %d slots failing %s: played %d, slots used at most %d, left %d' % (
+            'ok' if passed else 'FAILED', device.ff_effects_count, ", ".join(device.fail) or 'nothing', *result))
+    return ok
+
+
+def present_ff(dev, exerciser):
+    """Generate description of force feedback capabilities and exerciser results for urwid."""
+    text = [('emph', "FORCE FEEDBACK:",)]
+    caps = dev.capabilities()
+    text.append('   effects: %s' % ", ".join(_ff_name(c) for c in caps[evdev.ecodes.EV_FF]))
+    text.append('   effect slots: %s' % dev.ff_effects_count)
+    if exerciser is None:
+        text.append('   exerciser: [press F4 to run]')
+        return text
+    text.append('   exerciser: %s, %s steps, %s played' % (exerciser.state, len(exerciser.script), exerciser.played))
+    text.append('   slots used: %d of %d' % (exerciser.slots_used_max, exerciser.slots))
+    text.append('   upload latency: %s' % exerciser.upload_latency)
+    text.append('   play latency: %s' % exerciser.play_latency)
+    text.append('   stop latency: %s' % exerciser.stop_latency)
+    text.append('   erase latency: %s' % exerciser.erase_latency)
+    for e in exerciser.errors:
+        text.append(('error', '   error: %s' % e))
+    return text
+
+
+# Session file layout:
+#   header: SESSION_MAGIC, u32 metadata length, JSON metadata
+#   records: SESSION_RECORD (kind, payload length, timestamp) followed by payload
+#     - event payload: SESSION_EVENT (type, code, value)
+#     - keyframe payload: u16 keys count, u16 axes count, u16 key codes, (u16 code, i32 value) axes
+#   index: SESSION_INDEX_ENTRY (timestamp, offset) for each keyframe, written when recording is closed
+#   trailer: SESSION_TRAILER (magic, index offset, index entries count, last timestamp)
+SESSION_MAGIC = b'GPISESS1'
+SESSION_INDEX_MAGIC = b'GPIINDX1'
+SESSION_RECORD = struct.Struct('<BHd')
+SESSION_EVENT = struct.Struct('<HHi')
+SESSION_INDEX_ENTRY = struct.Struct('<dQ')
+SESSION_TRAILER = struct.Struct('<8sQQd')
+SESSION_KIND_EVENT = 1
+SESSION_KIND_KEYFRAME = 2
+# keyframe is written after this many seconds or events, it bounds work needed to seek
+KEYFRAME_INTERVAL = 1.0
+KEYFRAME_EVENTS = 1000
+
+
+class SessionWriter(object):
+    """Record buttons and axes events of evdev device to session file with periodic keyframes."""
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, path, device):
+        self.path = path
+        self.device = device
+        self.keys = set(device.active_keys())
+        self.axes = {}
+        axes_max = {}
+        for a, info in device.capabilities().get(evdev.ecodes.EV_ABS, []):
+            self.axes[a] = info.value
+            axes_max[a] = info.max
+        self.index = []
+        self.events = 0
+        self.events_since_keyframe = 0
+        self.last_timestamp = time.time()
+
+        self.file = open(path, 'wb')  # pylint: disable=consider-using-with
+        metadata = json.dumps(dict(name=device.name, fn=device.fn, start=self.last_timestamp, axes_max=axes_max)).encode('utf-8')
+        self.file.write(SESSION_MAGIC + struct.pack('<I', len(metadata)) + metadata)
+        self.offset = len(SESSION_MAGIC) + 4 + len(metadata)
+        self.write_keyframe(self.last_timestamp)
+
+    def _write_record(self, kind, timestamp, payload):
+        self.file.write(SESSION_RECORD.pack(kind, len(payload), timestamp) + payload)
+        self.offset += SESSION_RECORD.size + len(payload)
+
+    def write_keyframe(self, timestamp):
+        self.index.append((timestamp, self.offset))
+        keys = sorted(self.keys)
+        payload = struct.pack('<HH%dH' % len(keys), len(keys), len(self.axes), *keys)
+        payload += b''.join(struct.pack('<Hi', a, v) for a, v in sorted(self.axes.items()))
+        self._write_record(SESSION_KIND_KEYFRAME, timestamp, payload)
+        self.events_since_keyframe = 0
+
+    def write_event(self, event):
+        if event.type not in (evdev.ecodes.EV_KEY, evdev.ecodes.EV_ABS):
+            return
+        timestamp = event.timestamp()
+        if timestamp - self.index[-1][0] >= KEYFRAME_INTERVAL or self.events_since_keyframe >= KEYFRAME_EVENTS:
+            self.write_keyframe(timestamp)
+        self._write_record(SESSION_KIND_EVENT, timestamp, SESSION_EVENT.pack(event.type, event.code, event.value))
+        _apply_session_event(self.keys, self.axes, event.type, event.code, event.value)
+        self.events += 1
+        self.events_since_keyframe += 1
+        self.last_timestamp = max(self.last_timestamp, timestamp)
+
+    def close(self):
+        index_offset = self.offset
+        self.file.write(b''.join(SESSION_INDEX_ENTRY.pack(t, o) for t, o in self.index))
+        self.file.write(SESSION_TRAILER.pack(SESSION_INDEX_MAGIC, index_offset, len(self.index), self.last_timestamp))
+        self.file.close()
+
+
+def _apply_session_event(keys, axes, etype, code, value):
+    if etype == evdev.ecodes.EV_KEY:
+        if value:
+            keys.add(code)
+        else:
+            keys.discard(code)
+    else:
+        axes[code] = value
+
+
+class SessionReader(object):
+    """Random access to session file through mmap.
+
+    Only the trailer, a few index entries found by binary search and records since the nearest
+    keyframe are touched to reconstruct the state, so even huge sessions open instantly.
+    Session that was not closed properly has no index, it is rebuilt by scanning the file.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')  # pylint: disable=consider-using-with
+        try:
+            if os.fstat(self.file.fileno()).st_size < len(SESSION_MAGIC) + 4:
+                raise ValueError('%s is not a session file' % path)
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self.mmap, 'madvise'):
+                self.mmap.madvise(mmap.MADV_RANDOM)
+            self._open()
+        except (OSError, ValueError):
+            self.close()
+            raise
+
+    def _open(self):
+        if self.mmap[:len(SESSION_MAGIC)] != SESSION_MAGIC:
+            raise ValueError('%s is not a session file' % self.path)
+        (metadata_len,) = struct.unpack_from('<I', self.mmap, len(SESSION_MAGIC))
+        records_start = len(SESSION_MAGIC) + 4
+        if records_start + metadata_len > len(self.mmap):
+            raise ValueError('%s is truncated' % self.path)
+        self.metadata = json.loads(self.mmap[records_start:records_start + metadata_len].decode('utf-8'))
+        if not isinstance(self.metadata, dict) or not {'name', 'fn', 'axes_max'} <= set(self.metadata):
+            raise ValueError('%s has invalid metadata' % self.path)
+        self.axes_max = {int(a): m for a, m in self.metadata['axes_max'].items()}
+        self.records_start = records_start + metadata_len
+
+        trailer = None
+        if len(self.mmap) >= self.records_start + SESSION_TRAILER.size:
+            trailer = SESSION_TRAILER.unpack_from(self.mmap, len(self.mmap) - SESSION_TRAILER.size)
+        if trailer and trailer[0] == SESSION_INDEX_MAGIC and self._valid_index(trailer[1], trailer[2]):
+            _, self.records_end, self.index_count, self.end = trailer
+            self.index = None
+        else:
+            self.records_end = len(self.mmap)
+            self._rebuild_index()
+        self.start = self.index_entry(0)[0]
+
+    def _valid_index(self, index_offset, index_count):
+        index_end = index_offset + index_count * SESSION_INDEX_ENTRY.size
+        return index_count and self.records_start <= index_offset and index_end == len(self.mmap) - SESSION_TRAILER.size
+
+    def _rebuild_index(self):
+        self.index = []
+        self.end = 0.0
+        offset = self.records_start
+        while offset + SESSION_RECORD.size <= self.records_end:
+            kind, length, timestamp = SESSION_RECORD.unpack_from(self.mmap, offset)
+            if offset + SESSION_RECORD.size + length > self.records_end:
+                break  # record truncated by interrupted recording
+            if kind == SESSION_KIND_KEYFRAME:
+                self.index.append((timestamp, offset))
+            self.end = max(self.end, timestamp)
+            offset += SESSION_RECORD.size + length
+        self.records_end = offset
+        self.index_count = len(self.index)
+        if not self.index:
+            raise ValueError('%s has no keyframes' % self.path)
+
+    def index_entry(self, i):
+        """Return (timestamp, offset) of i-th keyframe, raise ValueError if the index on disk points elsewhere."""
+        if self.index is not None:
+            return self.index[i]
+        timestamp, offset = SESSION_INDEX_ENTRY.unpack_from(self.mmap, self.records_end + i * SESSION_INDEX_ENTRY.size)
+        # entries are checked only when used so opening stays instant
+        if not self.records_start <= offset <= self.records_end - SESSION_RECORD.size:
+            raise ValueError('%s has index entry %d pointing outside of records' % (self.path, i))
+        kind, length, _ = SESSION_RECORD.unpack_from(self.mmap, offset)
+        if kind != SESSION_KIND_KEYFRAME or offset + SESSION_RECORD.size + length > self.records_end:
+            raise ValueError('%s has index entry %d not pointing at a keyframe' % (self.path, i))
+        return timestamp, offset
+
+    def find_keyframe(self, timestamp):
+        """Return offset of the last keyframe not later than timestamp."""
+        lo, hi = 0, self.index_count
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if self.index_entry(mid)[0] <= timestamp:
+                lo = mid
+            else:
+                hi = mid
+        return self.index_entry(lo)[1]
+
+    def state_at(self, timestamp):
+        """Reconstruct pressed keys and axes values at timestamp."""
+        keys = set()
+        axes = {}
+        offset = self.find_keyframe(timestamp)
+        keyframe = True
+        while offset < self.records_end:
+            kind, length, record_time = SESSION_RECORD.unpack_from(self.mmap, offset)
+            # the keyframe is always applied, even when seeking before the beginning of the session
+            if record_time > timestamp and not keyframe:
+                break
+            keyframe = False
+            payload = offset + SESSION_RECORD.size
+            if kind == SESSION_KIND_KEYFRAME:
+                keys_count, axes_count = struct.unpack_from('<HH', self.mmap, payload)
+                keys = set(struct.unpack_from('<%dH' % keys_count, self.mmap, payload + 4))
+                axes_start = payload + 4 + keys_count * 2
+                axes = dict(struct.iter_unpack('<Hi', self.mmap[axes_start:axes_start + axes_count * 6]))
+            else:
+                _apply_session_event(keys, axes, *SESSION_EVENT.unpack_from(self.mmap, payload))
+            offset = payload + length
+        return keys, axes
+
+    def close(self):
+        if getattr(self, 'mmap', None):
+            self.mmap.close()
+        self.file.close()
+
+
 class DeviceTreeWidget(urwid.TreeWidget):
     """ Display widget for leaf nodes """
     def get_display_text(self):
@@ -294,6 +1244,8 @@ class DeviceBox(urwid.LineBox):
         self.lines_box = urwid.ListBox(self.lines)
         super(DeviceBox, self).__init__(self.lines_box, 'Dev Box: [select device]')
         self.device = None
+        self.passthrough = None
+        self.ff_exerciser = None
 
     def show_device(self, device):
         self.device = device
@@ -306,6 +1258,14 @@ class DeviceBox(urwid.LineBox):
                     text += present_sdl2_gamepad(data['sdl2'])
                 if 'evdev' in data:
                     text += present_evdev_gamepad(data['evdev'])
+                    text += present_controller_mapping(data['evdev'])
+                    if self.passthrough and self.passthrough.device.fn == data['evdev'].fn:
+                        text += present_passthrough(self.passthrough)
+                    if evdev.ecodes.EV_FF in data['evdev'].capabilities():
+                        exerciser = self.ff_exerciser
+                        if exerciser and exerciser.device.fn != data['evdev'].fn:
+                            exerciser = None
+                        text += present_ff(data['evdev'], exerciser)
                 if 'pygame' in data:
                     text += present_pygame_gamepad(data['pygame'])
                 if 'jsio' in data:
@@ -389,10 +1349,12 @@ class Udev(object):
                 result['children'].append(st)
         return result
 
-    def setup_monitor(self, ui_wakeup_fd):
+    def setup_monitor(self, ui_wakeup_fd, subsystem=None):
         self.ui_wakeup_fd = ui_wakeup_fd
 
         self.monitor = pyudev.Monitor.from_netlink(self.ctx)
+        if subsystem:
+            self.monitor.filter_by(subsystem)
         self.observer = pyudev.MonitorObserver(self.monitor, self.send_event_to_ui_thread)
         self.observer.start()
 
@@ -411,19 +1373,23 @@ class GamePadStateBox(urwid.Text):
 
     def _update_evdev_state(self, device, event):
         buttons = [BUTTON_NAMES[k[1]] if k[0] == '?' else k[0] for k in device.active_keys(verbose=True)]
-        text = "Buttons: %s\n" % ", ".join(buttons)
 
         if event.type == evdev.ecodes.EV_ABS:
             self.axes[event.code] = event.value
 
         caps = device.capabilities()
-        axes_caps = {}
+        axes_max = {}
         for a, info in caps[evdev.ecodes.EV_ABS]:
-            axes_caps[a] = info
+            axes_max[a] = info.max
+
+        self.show_evdev_state(buttons, self.axes, axes_max)
+
+    def show_evdev_state(self, buttons, axes, axes_max):
+        text = "Buttons: %s\n" % ", ".join(buttons)
 
         text += "Axes:\n"
-        for c, val in self.axes.items():
-            text += "  %s: %d/%d\n" % (evdev.ecodes.ABS[c][4:], val, axes_caps[c].max)
+        for c, val in axes.items():
+            text += "  %s: %d/%d\n" % (evdev.ecodes.ABS[c][4:], val, axes_max[c])
 
         self.set_text(text)
 
@@ -494,6 +1460,9 @@ class ConsoleUI(object):
         ('key', "END"), ":Navigate Devices Tree and select device  ",
         ('key', "F1"), ":Help  ",
         ('key', "F2"), ":Switch Log Box/GamePad State  ",
+        ('key', "F3"), ":Toggle passthrough  ",
+        ('key', "F4"), ":Run force feedback  ",
+        ('key', "F5"), ":Toggle recording  ",
         ('key', "ESC"), ",",
         ('key', "Q"), ":Quit"
     ], [
@@ -505,6 +1474,9 @@ class ConsoleUI(object):
         ('key', "PAGE DOWN"), ":Scroll Dev Box content  ",
         ('key', "F1"), ":Help  ",
         ('key', "F2"), ":Switch Log Box/GamePad State  ",
+        ('key', "F3"), ":Toggle passthrough  ",
+        ('key', "F4"), ":Run force feedback  ",
+        ('key', "F5"), ":Toggle recording  ",
         ('key', "ESC"), ",",
         ('key', "Q"), ":Quit"
     ], [
@@ -516,17 +1488,23 @@ class ConsoleUI(object):
         ('key', "PAGE DOWN"), ":Scroll Log Box content  ",
         ('key', "F1"), ":Help  ",
         ('key', "F2"), ":Switch Log Box/GamePad State  ",
+        ('key', "F3"), ":Toggle passthrough  ",
+        ('key', "F4"), ":Run force feedback  ",
+        ('key', "F5"), ":Toggle recording  ",
         ('key', "ESC"), ",",
         ('key', "Q"), ":Quit"
     ]]
 
-    def __init__(self):
+    def __init__(self, remap_config=None, ff_script=None):
         self.udev_queue = queue.Queue()
         self.udev = Udev(self.udev_queue)
 
         # log box
         self.log_list = urwid.SimpleFocusListWalker([])
         self.log_list.append(urwid.Text(('dim', '%s: event monitoring started' % datetime.datetime.now())))
+        for source, count, load_time in CONTROLLER_DB.sources:
+            self.log_list.append(urwid.Text(('dim', '%s: loaded %d controller mappings from %s in %.3f ms' % (
+                datetime.datetime.now(), count, source, load_time * 1000))))
         self.log_box = urwid.ListBox(self.log_list)
         self.log_box_wrap = urwid.AttrMap(urwid.LineBox(self.log_box, 'Log Box'), 'normal', 'focus')
 
@@ -570,10 +1548,23 @@ class ConsoleUI(object):
         self.jsio_events_handler_task = None
         self.selected_jsio_device = None
 
+        self.remap_config = remap_config
+        self.passthrough = None
+        self.passthrough_refresh_time = 0
+
+        self.ff_script = ff_script
+        self.ff_task = None
+
+        self.recorder = None
+
     def main(self):
         """Run the program."""
 
-        self.loop.run()
+        try:
+            self.loop.run()
+        finally:
+            if self.recorder:
+                self.recorder.close()
 
     def switch_bottom_elem(self):
         self.bottom_elem_idx = 1 - self.bottom_elem_idx
@@ -599,6 +1590,12 @@ class ConsoleUI(object):
             self.view.footer = urwid.AttrWrap(urwid.Text(self.footer_texts[self.focus_pane]), 'foot')
         elif k == 'f2':
             self.switch_bottom_elem()
+        elif k == 'f3':
+            self.toggle_passthrough()
+        elif k == 'f4':
+            self.run_ff_exerciser()
+        elif k == 'f5':
+            self.toggle_recording()
         # else:
         #     self.log(k)
 
@@ -638,10 +1635,30 @@ class ConsoleUI(object):
 
     async def handle_evdev_events(self, device):
         while True:
-            events = await self.async_evdev_read(device)
-            for event in events:
-                self.log(str(event))
-                self.gamepad_state_box.update_state('evdev', device, event)
+            # read() returns a generator, it has to be iterated many times below
+            events = list(await self.async_evdev_read(device))
+            read_time = time.perf_counter()
+            latencies = None
+            if self.passthrough and self.passthrough.device is device:
+                # forward whole batch first so recording and the UI do not add to its latency
+                latencies = [self.passthrough.forward(event) for event in events]
+            if self.recorder and self.recorder.device is device:
+                for event in events:
+                    self.recorder.write_event(event)
+            if latencies is not None:
+                for event, latency in zip(events, latencies):
+                    if latency is None:
+                        self.log('%s dropped' % event)
+                    else:
+                        self.log('%s forwarded +%.3f ms' % (event, latency * 1000))
+                    self.gamepad_state_box.update_state('evdev', device, event)
+                if read_time - self.passthrough_refresh_time > 1:
+                    self.passthrough_refresh_time = read_time
+                    self.dev_box.show_device(self.dev_box.device)
+            else:
+                for event in events:
+                    self.log(str(event))
+                    self.gamepad_state_box.update_state('evdev', device, event)
             if not self.evdev_events_handler_task:
                 break
 
@@ -672,7 +1689,94 @@ class ConsoleUI(object):
             if not self.jsio_events_handler_task:
                 break
 
+    def toggle_passthrough(self):
+        if self.passthrough:
+            self.stop_passthrough()
+        elif self.evdev_events_handler_task:
+            device = self.selected_evdev_device
+            try:
+                passthrough = EvdevPassthrough(device, EventRemapper(device, self.remap_config))
+                passthrough.start()
+            except (OSError, ValueError) as e:
+                self.log('cannot start passthrough of evdev %s: %s' % (device, e))
+                return
+            self.passthrough = passthrough
+            self.dev_box.passthrough = passthrough
+            self.log('started passthrough of evdev %s' % device)
+        else:
+            self.log('passthrough requires selecting evdev device')
+            return
+        self.dev_box.show_device(self.dev_box.device)
+
+    def stop_passthrough(self):
+        self.passthrough.stop()
+        self.log('stopped passthrough of evdev %s, forwarded %d events, added latency: %s' % (
+            self.passthrough.device, self.passthrough.forwarded, self.passthrough.added_latency))
+        self.passthrough = None
+        self.dev_box.passthrough = None
+
+    def run_ff_exerciser(self):
+        if self.ff_task:
+            self.log('force feedback exerciser is already running')
+            return
+        if not self.evdev_events_handler_task:
+            self.log('force feedback requires selecting evdev device')
+            return
+        device = self.selected_evdev_device
+        try:
+            exerciser = ForceFeedbackExerciser(device, self.ff_script)
+        except ValueError as e:
+            self.log('cannot run force feedback on evdev %s: %s' % (device, e))
+            return
+        self.dev_box.ff_exerciser = exerciser
+        self.log('started force feedback exerciser on evdev %s' % device)
+        self.ff_task = asyncio.ensure_future(self.handle_ff_exerciser(exerciser), loop=self.aloop)
+
+    async def handle_ff_exerciser(self, exerciser):
+        try:
+            await exerciser.run()
+            self.log('force feedback exerciser on evdev %s finished, upload latency: %s, play latency: %s' % (
+                exerciser.device, exerciser.upload_latency, exerciser.play_latency))
+        except asyncio.CancelledError:  # pylint: disable=try-except-raise
+            raise  # it is an Exception before Python 3.8, cancelling is not a failure
+        except Exception as e:  # pylint: disable=broad-except
+            # the exerciser runs in its own task, any exception from it would stop the whole UI
+            self.log('force feedback exerciser on evdev %s failed: %r' % (exerciser.device, e))
+        finally:
+            self.ff_task = None
+            self.dev_box.show_device(self.dev_box.device)
+
+    def toggle_recording(self):
+        if self.recorder:
+            self.stop_recording()
+        elif self.evdev_events_handler_task:
+            path = datetime.datetime.now().strftime('gamepadinfo-%Y%m%d-%H%M%S.gpsession')
+            try:
+                self.recorder = SessionWriter(path, self.selected_evdev_device)
+            except OSError as e:
+                self.log('cannot record evdev %s to %s: %s' % (self.selected_evdev_device, path, e))
+                return
+            self.log('started recording evdev %s to %s' % (self.selected_evdev_device, path))
+        else:
+            self.log('recording requires selecting evdev device')
+
+    def stop_recording(self):
+        self.recorder.close()
+        self.log('stopped recording evdev %s to %s, %d events, %d keyframes' % (
+            self.recorder.device, self.recorder.path, self.recorder.events, len(self.recorder.index)))
+        self.recorder = None
+
     def node_visited(self, device):
+        if self.passthrough:
+            self.stop_passthrough()
+
+        if self.recorder:
+            self.stop_recording()
+
+        if self.ff_task:
+            self.log('stopped force feedback exerciser on evdev %s' % self.dev_box.ff_exerciser.device)
+            self.ff_task.cancel()
+
         self.dev_box.show_device(device)
 
         if self.evdev_events_handler_task:
@@ -699,8 +1803,473 @@ class ConsoleUI(object):
                 self.jsio_events_handler_task = asyncio.ensure_future(self.handle_jsio_events(data['jsio']), loop=self.aloop)
 
 
+class SessionViewer(object):
+    """Show reconstructed gamepad state of recorded session at any moment."""
+    # pylint: disable=too-many-instance-attributes
+    palette = ConsoleUI.palette
+
+    footer_text = [
+        ('key', "LEFT"), ",",
+        ('key', "RIGHT"), ":-/+0.1s  ",
+        ('key', "DOWN"), ",",
+        ('key', "UP"), ":-/+1s  ",
+        ('key', "PAGE DOWN"), ",",
+        ('key', "PAGE UP"), ":-/+10s  ",
+        ('key', "HOME"), ",",
+        ('key', "END"), ":Start/End  ",
+        ('key', "J"), ":Jump to second  ",
+        ('key', "SPACE"), ":Play/Pause  ",
+        ('key', "ESC"), ",",
+        ('key', "Q"), ":Quit"
+    ]
+    steps = {'left': -0.1, 'right': 0.1, 'down': -1, 'up': 1, 'page down': -10, 'page up': 10}
+    play_step = 0.05
+
+    def __init__(self, path):
+        self.session = SessionReader(path)
+        self.position = self.session.start
+        self.playing = False
+        self.play_alarm = None
+
+        self.info = urwid.Text('')
+        self.gamepad_state_box = GamePadStateBox('-')
+        self.footer = urwid.AttrWrap(urwid.Text(self.footer_text), 'foot')
+        body = urwid.Pile([('pack', urwid.LineBox(self.info, 'Session')),
+                           urwid.LineBox(urwid.Filler(self.gamepad_state_box, valign='top'), 'GamePad State Box')])
+        self.view = urwid.Frame(
+            body,
+            header=urwid.AttrWrap(urwid.Text(" -= GamePad Info: %s =-" % path), 'head'),
+            footer=self.footer)
+        self.loop = urwid.MainLoop(self.view, self.palette, unhandled_input=self.unhandled_input)
+        self.seek(self.position)
+
+    def main(self):
+        try:
+            self.loop.run()
+        finally:
+            self.session.close()
+
+    def seek(self, position):
+        self.position = max(self.session.start, min(self.session.end, position))
+        keys, axes = self.session.state_at(self.position)
+        self.info.set_text('device: %s (%s)\nstarted: %s\nposition: %.3f s of %.3f s, %d keyframes' % (
+            self.session.metadata['name'], self.session.metadata['fn'],
+            datetime.datetime.fromtimestamp(self.session.start),
+            self.position - self.session.start, self.session.end - self.session.start, self.session.index_count))
+        self.gamepad_state_box.show_evdev_state([BUTTON_NAMES[k] for k in sorted(keys)], axes, self.session.axes_max)
+
+    def play(self, loop=None, user_data=None):
+        # pylint: disable=unused-argument
+        self.play_alarm = None
+        if not self.playing:
+            return
+        self.seek(self.position + self.play_step)
+        if self.position >= self.session.end:
+            self.playing = False
+        else:
+            self.play_alarm = self.loop.set_alarm_in(self.play_step, self.play)
+
+    def unhandled_input(self, k):
+        if self.view.focus_position == 'footer':
+            if k == 'enter':
+                try:
+                    position = float(self.view.footer.get_edit_text())
+                except ValueError:
+                    position = None
+                if position is not None:
+                    self.seek(self.session.start + position)
+            if k in ('enter', 'esc'):
+                self.view.footer = self.footer
+                self.view.focus_position = 'body'
+            return
+        if k in ('q', 'Q', 'esc'):
+            raise urwid.ExitMainLoop()
+        if k in self.steps:
+            self.seek(self.position + self.steps[k])
+        elif k == 'home':
+            self.seek(self.session.start)
+        elif k == 'end':
+            self.seek(self.session.end)
+        elif k in ('j', 'J'):
+            self.view.footer = urwid.Edit('Jump to second: ')
+            self.view.focus_position = 'footer'
+        elif k == ' ':
+            # only one alarm chain can run, otherwise playback speeds up with each resume
+            if self.play_alarm:
+                self.loop.remove_alarm(self.play_alarm)
+            self.playing = not self.playing
+            self.play()
+
+
+def parse_address(address):
+    """Parse socket address given as 'unix:/path/to/socket' or 'host:port'."""
+    if address.startswith('unix:'):
+        return 'unix', address[5:]
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError("address '%s' is neither unix:PATH nor HOST:PORT" % address)
+    return 'tcp', (host, int(port))
+
+
+def describe_evdev_gamepad(dev):
+    """Describe evdev gamepad with JSON serializable dict."""
+    caps = dev.capabilities()
+    return dict(name=dev.name, phys=dev.phys,
+                bustype=dev.info.bustype, vendor=dev.info.vendor, product=dev.info.product, version=dev.info.version,
+                axes=[evdev.ecodes.ABS[a[0]][4:] for a in caps.get(evdev.ecodes.EV_ABS, [])],
+                buttons=[BUTTON_NAMES[k] for k in caps.get(evdev.ecodes.EV_KEY, [])])
+
+
+def collect_inventory(udev):
+    """Scan devices and return flat inventory dict that can be compared and diffed key by key."""
+    inventory = {}
+
+    def add_subtree(node, parent):
+        for child in node['children']:
+            dev = child['dev']
+            inventory['node:' + dev.sys_path] = dict(parent=parent, name=child['name'], devname=dev.get('DEVNAME'))
+            add_subtree(child, dev.sys_path)
+
+    add_subtree(udev.get_dev_tree(), None)
+
+    for fn, data in INPUT_DEVICES.items():
+        desc = {}
+        if 'evdev' in data:
+            desc['evdev'] = describe_evdev_gamepad(data['evdev'])
+        if 'jsio' in data:
+            desc['jsio'] = {k: v for k, v in data['jsio'].items() if k != 'file'}
+        if 'sdl2' in data:
+            desc['sdl2'] = dict(guid=sdl_joystickgetguidstring(sdl2.joystick.SDL_JoystickGetGUID(data['sdl2'])))
+        inventory['input:' + fn] = desc
+    return inventory
+
+
+def inventory_delta(old, new):
+    """Return entries that were changed or added and keys of entries that were removed."""
+    changed = {k: v for k, v in new.items() if old.get(k) != v}
+    removed = [k for k in old if k not in new]
+    return changed, removed
+
+
+class InventoryAgent(object):
+    """Publish devices inventory and periodic state and latency summaries to aggregator.
+
+    The connection is kept open. The first message after connecting is a full snapshot,
+    then only deltas against the previously sent inventory are sent every interval.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, address, host_id, interval):
+        self.address = parse_address(address)
+        self.host_id = host_id
+        self.interval = interval
+        self.aloop = asyncio.get_event_loop()
+
+        self.udev_queue = queue.Queue()
+        self.udev = Udev(self.udev_queue)
+        self.inventory = {}
+        self.states = {}
+        self.rescan_needed = True
+        self.udev_wakeup_fd = None
+
+    def log(self, text):
+        print('%s: %s' % (datetime.datetime.now(), text))
+
+    def handle_udev_event(self):
+        os.read(self.udev_wakeup_fd, 4096)
+        while not self.udev_queue.empty():
+            self.udev_queue.get(block=False)
+        self.rescan_needed = True
+
+    def rescan(self):
+        for state in self.states.values():
+            self.aloop.remove_reader(state['device'].fileno())
+        self.inventory = collect_inventory(self.udev)
+        self.states = {}
+        for fn, data in INPUT_DEVICES.items():
+            if 'evdev' not in data:
+                continue
+            self.states[fn] = dict(device=data['evdev'], axes={}, events=0, latency=LatencyStats())
+            self.aloop.add_reader(data['evdev'].fileno(), self.read_evdev_events, fn)
+        self.rescan_needed = False
+
+    def read_evdev_events(self, devname):
+        state = self.states[devname]
+        try:
+            events = list(state['device'].read())
+        except BlockingIOError:
+            return
+        except OSError:
+            # device is gone, it will be removed from inventory by rescan triggered by udev
+            self.aloop.remove_reader(state['device'].fileno())
+            return
+        now = time.time()
+        for event in events:
+            state['events'] += 1
+            state['latency'].add(now - event.timestamp())
+            if event.type == evdev.ecodes.EV_ABS:
+                state['axes'][evdev.ecodes.ABS[event.code][4:]] = event.value
+
+    def snapshot(self):
+        """Return inventory with current state of gamepads and latency summary since previous snapshot."""
+        if self.rescan_needed:
+            self.rescan()
+        inventory = dict(self.inventory)
+        for fn, state in self.states.items():
+            try:
+                buttons = [BUTTON_NAMES[k] for k in state['device'].active_keys()]
+            except OSError:
+                buttons = []
+            latency = state['latency']
+            inventory['state:' + fn] = dict(buttons=buttons, axes=dict(state['axes']), events=state['events'],
+                                            latency_avg=latency.total / latency.count if latency.count else None,
+                                            latency_max=latency.max)
+            state['latency'] = LatencyStats()
+        return inventory
+
+    async def connect(self):
+        if self.address[0] == 'unix':
+            return await asyncio.open_unix_connection(self.address[1])
+        return await asyncio.open_connection(*self.address[1])
+
+    async def send(self, writer, msg):
+        writer.write(json.dumps(msg, sort_keys=True).encode('utf-8') + b'\n')
+        await writer.drain()
+
+    async def publish(self):
+        while True:
+            try:
+                _, writer = await self.connect()
+            except OSError as e:
+                self.log('cannot connect to aggregator: %s' % e)
+                await asyncio.sleep(self.interval)
+                continue
+            self.log('connected to aggregator')
+            try:
+                sent = self.snapshot()
+                seq = 0
+                await self.send(writer, dict(type='snapshot', host=self.host_id, seq=seq, interval=self.interval, inventory=sent))
+                while True:
+                    await asyncio.sleep(self.interval)
+                    inventory = self.snapshot()
+                    changed, removed = inventory_delta(sent, inventory)
+                    seq += 1
+                    # empty delta is sent too, it works as a heartbeat checked by aggregator
+                    await self.send(writer, dict(type='delta', host=self.host_id, seq=seq, set=changed, remove=removed))
+                    sent = inventory
+            except OSError as e:
+                self.log('lost connection to aggregator: %s' % e)
+                writer.close()
+                await asyncio.sleep(self.interval)
+
+    def main(self):
+        self.udev_wakeup_fd, ui_wakeup_fd = os.pipe()
+        # rescan reopens all devices so it is triggered only by input devices
+        self.udev.setup_monitor(ui_wakeup_fd, subsystem='input')
+        self.aloop.add_reader(self.udev_wakeup_fd, self.handle_udev_event)
+        self.aloop.run_until_complete(self.publish())
+
+
+def _check_state_entry(key, state):
+    """Check state entry sent by agent, raise ValueError if it is malformed."""
+    if not isinstance(state, dict):
+        raise ValueError('%s is not an object' % key)
+    if not isinstance(state.get('events'), int) or isinstance(state['events'], bool):
+        raise ValueError('events of %s is not an integer' % key)
+    if not isinstance(state.get('buttons'), list) or not all(isinstance(b, str) for b in state['buttons']):
+        raise ValueError('buttons of %s is not a list of names' % key)
+    if not isinstance(state.get('axes'), dict):
+        raise ValueError('axes of %s is not an object' % key)
+    if 'latency_avg' not in state or 'latency_max' not in state:
+        raise ValueError('latency of %s is missing' % key)
+    if state['latency_avg'] is not None and not (_is_number(state['latency_avg']) and _is_number(state['latency_max'])):
+        raise ValueError('latency of %s is not a number' % key)
+
+
+def check_inventory_message(msg):
+    """Check schema of snapshot or delta message sent by agent, raise ValueError if it is malformed."""
+    if not isinstance(msg, dict):
+        raise ValueError('message is not an object')
+    if msg.get('type') not in ('snapshot', 'delta'):
+        raise ValueError("unknown message type '%s'" % (msg.get('type'),))
+    if not isinstance(msg.get('host'), str):
+        raise ValueError('host is not a string')
+    if not isinstance(msg.get('seq'), int) or isinstance(msg['seq'], bool):
+        raise ValueError('seq is not an integer')
+    if msg['type'] == 'snapshot':
+        if 'interval' in msg and not (_is_number(msg['interval']) and msg['interval'] > 0):
+            raise ValueError('interval is not a positive number')
+        entries = msg.get('inventory')
+        if not isinstance(entries, dict):
+            raise ValueError('inventory is not an object')
+    else:
+        entries = msg.get('set')
+        if not isinstance(entries, dict):
+            raise ValueError('set is not an object')
+        if not isinstance(msg.get('remove'), list) or not all(isinstance(k, str) for k in msg['remove']):
+            raise ValueError('remove is not a list of keys')
+    for key, value in entries.items():
+        if key.startswith('state:'):
+            _check_state_entry(key, value)
+
+
+class InventoryAggregator(object):
+    """Accept persistent connections from many agents and merge their inventories.
+
+    Agent that does not send anything for AGENT_TIMEOUT_INTERVALS of its intervals is considered dead
+    and its connection is dropped.
+    """
+    AGENT_TIMEOUT_INTERVALS = 3
+    # how long to wait for the first message when agent's interval is not known yet
+    FIRST_MESSAGE_TIMEOUT = 60
+
+    def __init__(self, address):
+        self.address = parse_address(address)
+        self.aloop = asyncio.get_event_loop()
+        # host -> dict(inventory, seq, connection, connected)
+        self.hosts = {}
+
+    def log(self, text):
+        print('%s: %s' % (datetime.datetime.now(), text))
+
+    def apply(self, msg, connection):
+        """Merge snapshot or delta message received over connection into host's inventory. Return changed keys.
+
+        Malformed message raises ValueError before anything is merged.
+        """
+        check_inventory_message(msg)
+        host = msg['host']
+        if msg['type'] == 'snapshot':
+            # a snapshot comes first on each connection, the newest connection of the host wins
+            self.hosts[host] = dict(inventory=msg['inventory'], seq=msg['seq'], connection=connection, connected=True)
+            return list(msg['inventory'].keys())
+        entry = self.hosts.get(host)
+        if entry is None or entry['connection'] is not connection:
+            raise ValueError('delta %s from %s over connection that is not the current one' % (msg['seq'], host))
+        if msg['seq'] != entry['seq'] + 1:
+            raise ValueError('delta %s from %s does not follow previous message' % (msg['seq'], host))
+        entry['seq'] = msg['seq']
+        entry['inventory'].update(msg['set'])
+        for k in msg['remove']:
+            entry['inventory'].pop(k, None)
+        return list(msg['set'].keys()) + msg['remove']
+
+    def summary(self, host):
+        entry = self.hosts[host]
+        inventory = entry['inventory']
+        inputs = [k for k in inventory if k.startswith('input:')]
+        text = '%s: %s, %d input devices' % (host, 'connected' if entry['connected'] else 'disconnected', len(inputs))
+        for k in sorted(inventory):
+            if not k.startswith('state:'):
+                continue
+            state = inventory[k]
+            latency = ''
+            if state['latency_avg'] is not None:
+                latency = ', latency avg %.3f ms, max %.3f ms' % (state['latency_avg'] * 1000, state['latency_max'] * 1000)
+            text += '\n   %s: %d events%s, buttons: %s' % (k[6:], state['events'], latency, ", ".join(state['buttons']))
+        return text
+
+    async def handle_agent(self, reader, writer):
+        host = None
+        timeout = self.FIRST_MESSAGE_TIMEOUT
+        try:
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout)
+                if not line:
+                    break
+                msg = json.loads(line.decode('utf-8'))
+                changed = self.apply(msg, writer)
+                host = msg['host']
+                if 'interval' in msg:
+                    timeout = self.AGENT_TIMEOUT_INTERVALS * msg['interval']
+                if changed:
+                    self.log(self.summary(host))
+        except asyncio.TimeoutError:
+            self.log('dropping connection from %s: no message for %g s' % (host or 'unknown agent', timeout))
+        except (ValueError, OSError) as e:
+            self.log('dropping connection from %s: %s' % (host or 'unknown agent', e))
+        finally:
+            writer.close()
+            # the host could already reconnect, then its new connection is alive
+            if host in self.hosts and self.hosts[host]['connection'] is writer:
+                self.hosts[host]['connected'] = False
+                self.hosts[host]['connection'] = None
+                self.log('%s: disconnected' % host)
+
+    def main(self):
+        if self.address[0] == 'unix':
+            if os.path.exists(self.address[1]):
+                os.unlink(self.address[1])
+            server = asyncio.start_unix_server(self.handle_agent, self.address[1], limit=16 * 1024 * 1024)
+        else:
+            server = asyncio.start_server(self.handle_agent, *self.address[1], limit=16 * 1024 * 1024)
+        self.aloop.run_until_complete(server)
+        self.log('waiting for agents')
+        self.aloop.run_forever()
+
+
+def _load_option_file(parser, loader, path, what):
+    if not path:
+        return None
+    try:
+        return loader(path)
+    except (OSError, ValueError) as e:
+        return parser.error('cannot load %s %s: %s' % (what, path, e))
+
+
 def main():
-    ui = ConsoleUI()
+    parser = argparse.ArgumentParser(description='Detect gamepads and show their state on Linux.')
+    parser.add_argument('--remap', metavar='FILE',
+                        help='JSON file with buttons remapping and axes calibration and deadzones used by passthrough (F3)')
+    parser.add_argument('--ff-script', metavar='FILE',
+                        help='JSON file with force feedback steps played by exerciser (F4)')
+    parser.add_argument('--ff-selftest', action='store_true',
+                        help='run force feedback exerciser against in-process stand-in devices and exit')
+    parser.add_argument('--controller-db', metavar='FILE', action='append', default=[],
+                        help='SDL2 game controller mappings database (gamecontrollerdb.txt), can be given many times')
+    parser.add_argument('--play', metavar='SESSION',
+                        help='view session recorded with F5')
+    parser.add_argument('--agent', metavar='ADDRESS',
+                        help='run without UI and publish devices inventory to aggregator at unix:PATH or HOST:PORT')
+    parser.add_argument('--host-id', default=socket.gethostname(),
+                        help='name of this host reported by agent, default: %(default)s')
+    parser.add_argument('--interval', type=float, default=5.0,
+                        help='interval in seconds between updates sent by agent, default: %(default)s')
+    parser.add_argument('--aggregate', metavar='ADDRESS',
+                        help='run aggregator listening for agents at unix:PATH or HOST:PORT')
+    args = parser.parse_args()
+
+    # the same sources of mappings as SDL2 uses, the later ones override the earlier
+    db_files = args.controller_db
+    if os.environ.get('SDL_GAMECONTROLLERCONFIG_FILE'):
+        db_files = [os.environ['SDL_GAMECONTROLLERCONFIG_FILE']] + db_files
+    for path in db_files:
+        try:
+            CONTROLLER_DB.load(path)
+        except (OSError, ValueError) as e:
+            parser.error('cannot load controller db %s: %s' % (path, e))
+    if os.environ.get('SDL_GAMECONTROLLERCONFIG'):
+        CONTROLLER_DB.load_text(os.environ['SDL_GAMECONTROLLERCONFIG'], 'SDL_GAMECONTROLLERCONFIG')
+
+    if args.ff_selftest:
+        sys.exit(0 if ff_selftest() else 1)
+
+    try:
+        if args.play:
+            SessionViewer(args.play).main()
+            return
+        if args.aggregate:
+            InventoryAggregator(args.aggregate).main()
+            return
+        if args.agent:
+            InventoryAgent(args.agent, args.host_id, args.interval).main()
+            return
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    remap_config = _load_option_file(parser, load_remap_config, args.remap, 'remap config')
+    ff_script = _load_option_file(parser, load_ff_script, args.ff_script, 'force feedback script')
+
+    ui = ConsoleUI(remap_config=remap_config, ff_script=ff_script)
     ui.main()
 
 